@@ -1,3 +1,8 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+import numpy as np
 import streamlit as st
 import pandas as pd
 
@@ -10,44 +15,10 @@ PROD_URL = "https://docs.google.com/spreadsheets/d/1s928UrG19mxzVKWex31TJLu3c_jf
 DELIV_URL = "https://docs.google.com/spreadsheets/d/13AUingDUvNEhDpvJviIvs6wZr_c9Ifb6OYeFHN8tK-k/gviz/tq?tqx=out:csv&sheet=delivered_on_time"
 
 # ===========================
-# LOAD DATA (SAFE)
-# ===========================
-@st.cache_data(ttl=300)
-def load_data():
-    prod = pd.read_csv(PROD_URL)
-    deliv = pd.read_csv(DELIV_URL)
-
-    # Normalize headers safely
-    prod.columns = (
-        prod.columns.str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-        .str.replace("-", "_")
-    )
-
-    deliv.columns = (
-        deliv.columns.str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-        .str.replace("-", "_")
-    )
-
-    return prod, deliv
-
-
-prod_df, deliv_df = load_data()
-
-# ===========================
-# DEBUG VIEW (TEMPORARY)
-# ===========================
-st.write("✅ Production Columns:", prod_df.columns.tolist())
-st.write("✅ Delivery Columns:", deliv_df.columns.tolist())
-
-# ===========================
-# REQUIRED COLUMN CHECKS
+# REQUIRED COLUMNS
 # ===========================
-required_prod_cols = {"eventdate", "salesorderreference", "producedontime"}
-required_deliv_cols = {
+REQUIRED_PROD_COLS = {"eventdate", "salesorderreference", "producedontime"}
+REQUIRED_DELIV_COLS = {
     "soreference",
     "supplier",
     "delivereddate",
@@ -55,56 +26,219 @@ required_deliv_cols = {
     "delivery_country_code",
 }
 
-if not required_prod_cols.issubset(prod_df.columns):
-    st.error("❌ Missing required PRODUCTION columns")
-    st.stop()
 
-if not required_deliv_cols.issubset(deliv_df.columns):
-    st.error("❌ Missing required DELIVERY columns")
-    st.stop()
+def require_columns(df: pd.DataFrame, required: set[str], sheet: str) -> None:
+    missing = sorted(required - set(df.columns))
+    if missing:
+        raise ValueError(
+            f"Missing required {sheet} columns: {', '.join(missing)} "
+            f"(sheet has: {', '.join(df.attrs['sheet_columns'])})"
+        )
+
+
+# Reporting window: calendar year 2025
+YEAR_START = np.datetime64("2025-01-01")
+YEAR_END = np.datetime64("2026-01-01")
 
 # ===========================
-# DATE PARSING
+# LOAD DATA (SAFE)
 # ===========================
-prod_df["eventdate"] = pd.to_datetime(prod_df["eventdate"], errors="coerce")
-deliv_df["delivereddate"] = pd.to_datetime(deliv_df["delivereddate"], errors="coerce")
+# Header normalization: spaces and hyphens become underscores
+HEADER_SEPARATORS = str.maketrans({" ": "_", "-": "_"})
+
+
+def normalize_columns(columns: pd.Index) -> list[str]:
+    return [str(col).strip().lower().translate(HEADER_SEPARATORS) for col in columns]
+
+
+def read_sheet(url: str, columns: set[str]) -> pd.DataFrame:
+    """Download a sheet as CSV and parse only the columns the app uses.
+
+    The whole CSV is still downloaded; projecting only shrinks the parse
+    and the resulting frame. ``columns`` holds normalized names, so the
+    header line is parsed first to map them back to the sheet's own
+    spelling for ``usecols``. The full normalized header is kept in
+    ``attrs["sheet_columns"]`` for error reports and the debug view.
+    """
+    with urlopen(url) as resp:
+        raw = resp.read()
+
+    header = pd.read_csv(io.BytesIO(raw), nrows=0).columns
+    sheet_columns = normalize_columns(header)
+    usecols = [col for col, name in zip(header, sheet_columns) if name in columns]
+
+    # Arrow's multithreaded CSV reader is much faster than the default C engine
+    df = pd.read_csv(io.BytesIO(raw), engine="pyarrow", usecols=usecols)
+    df.columns = normalize_columns(df.columns)
+    df.attrs["sheet_columns"] = sheet_columns
+    return df
+
+
+def as_flag(values: pd.Series) -> pd.Series:
+    """Store an on-time flag as uint8 when it is a complete 0/1 column, else float32."""
+    if values.notna().all() and values.isin([0, 1]).all():
+        return values.astype("uint8")
+    return values.astype("float32")
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    # Both downloads are network-bound, so overlap them
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        prod_future = pool.submit(read_sheet, PROD_URL, REQUIRED_PROD_COLS)
+        deliv_future = pool.submit(read_sheet, DELIV_URL, REQUIRED_DELIV_COLS)
+        prod = prod_future.result()
+        deliv = deliv_future.result()
+
+    require_columns(prod, REQUIRED_PROD_COLS, "PRODUCTION")
+    require_columns(deliv, REQUIRED_DELIV_COLS, "DELIVERY")
+
+    # Date parsing; offsets are converted to naive UTC so the datetime64
+    # window compares below also work for timestamps like "...T10:00:00Z"
+    prod["eventdate"] = pd.to_datetime(
+        prod["eventdate"], errors="coerce", utc=True
+    ).dt.tz_localize(None)
+    deliv["delivereddate"] = pd.to_datetime(
+        deliv["delivereddate"], errors="coerce", utc=True
+    ).dt.tz_localize(None)
+
+    # Narrow flags: means and group sums stream far fewer bytes
+    prod["producedontime"] = as_flag(prod["producedontime"])
+    deliv["delivered_on_time"] = as_flag(deliv["delivered_on_time"])
+
+    # Rename for business meaning
+    deliv = deliv.rename(columns={"delivereddate": "delivery"})
+
+    # Filter 2025 only (plain datetime64 compares; NaT falls outside)
+    event = prod["eventdate"].to_numpy()
+    prod = prod[(event >= YEAR_START) & (event < YEAR_END)].copy()
+
+    delivered = deliv["delivery"].to_numpy()
+    deliv = deliv[(delivered >= YEAR_START) & (delivered < YEAR_END)].copy()
+
+    prod["month"] = prod["eventdate"].dt.month.astype("int8")
+    deliv["month"] = deliv["delivery"].dt.month.astype("int8")
+
+    # Deliveries without a supplier are reported under UNKNOWN, alongside
+    # production orders that have no delivery at all
+    deliv["supplier"] = deliv["supplier"].fillna("UNKNOWN")
+
+    # Low-cardinality group keys as categoricals: groupby runs on int codes
+    for col in ("supplier", "delivery_country_code"):
+        deliv[col] = deliv[col].astype("category")
+
+    # UNKNOWN also tags production orders with no delivery
+    if "UNKNOWN" not in deliv["supplier"].cat.categories:
+        deliv["supplier"] = deliv["supplier"].cat.add_categories("UNKNOWN")
+
+    # Supplier of each production order, joined once per cache fill
+    # rather than on every rerun. An order shipped by several suppliers
+    # appears once per supplier; repeat deliveries by the same supplier
+    # do not count the order twice.
+    order_suppliers = deliv[["soreference", "supplier"]].drop_duplicates()
+    prod_suppliers = prod[["salesorderreference"]].merge(
+        order_suppliers,
+        left_on="salesorderreference",
+        right_on="soreference",
+        how="left",
+    )[["salesorderreference", "supplier"]]
+
+    # Orders with no delivery get the UNKNOWN code written straight into
+    # the codes array; no string column is materialized
+    supplier_categories = prod_suppliers["supplier"].cat.categories
+    supplier_codes = prod_suppliers["supplier"].cat.codes.to_numpy().copy()
+    supplier_codes[supplier_codes < 0] = supplier_categories.get_loc("UNKNOWN")
+    prod_suppliers["supplier"] = pd.Categorical.from_codes(
+        supplier_codes, supplier_categories
+    )
+
+    # Monthly trend does not depend on anything chosen on the page
+    monthly_perf = pd.concat(
+        [
+            prod.groupby("month")["producedontime"].mean(),
+            deliv.groupby("month")["delivered_on_time"].mean(),
+        ],
+        axis=1,
+    )
+    monthly_perf.columns = ["Produced On Time", "Delivered On Time"]
 
-# Rename for business meaning
-deliv_df.rename(columns={"delivereddate": "delivery"}, inplace=True)
+    return prod, deliv, prod_suppliers, monthly_perf
 
-# Filter 2025 only
-prod_df = prod_df[prod_df["eventdate"].dt.year == 2025]
-deliv_df = deliv_df[deliv_df["delivery"].dt.year == 2025]
 
 # ===========================
-# MERGE
+# REQUIRED COLUMN CHECKS
 # ===========================
-joined_df = prod_df.merge(
-    deliv_df[
-        [
-            "soreference",
-            "supplier",
-            "delivered_on_time",
-            "delivery_country_code",
-            "delivery",
-        ]
-    ],
-    left_on="salesorderreference",
-    right_on="soreference",
-    how="left",
-)
+# Checked inside load_data so an incomplete sheet is never cached
+try:
+    prod_df, deliv_df, prod_suppliers, monthly_perf = load_data()
+except ValueError as exc:
+    st.error(f"❌ {exc}")
+    st.stop()
 
-joined_df["supplier"] = joined_df["supplier"].fillna("UNKNOWN")
+# ===========================
+# DEBUG VIEW
+# ===========================
+# Opt in with ?debug=1 so normal page loads skip the extra websocket writes
+if st.query_params.get("debug") == "1":
+    st.write("✅ Production Columns:", prod_df.attrs["sheet_columns"])
+    st.write("✅ Delivery Columns:", deliv_df.attrs["sheet_columns"])
 
 # ===========================
 # KPI CALCULATIONS
 # ===========================
-prod_ot = joined_df["producedontime"].mean()
+prod_ot = prod_df["producedontime"].mean()
 del_ot = deliv_df["delivered_on_time"].mean()
 
+# ===========================
+# DELIVERY AGGREGATES
+# ===========================
+# One np.bincount per statistic over each key's category codes
+flags = deliv_df["delivered_on_time"].to_numpy(dtype=np.float64)
+is_rated = ~np.isnan(flags)
+on_time = np.where(is_rated, flags, 0.0)
+has_order = deliv_df["soreference"].notna().to_numpy()
+
+
+def rollup(column: str) -> pd.DataFrame:
+    """Orders and on-time rate per category of ``column``.
+
+    Codes are shifted by one so a missing key lands in slot 0, which is
+    dropped, as are categories without any delivery rows.
+    """
+    cat = deliv_df[column].cat
+    codes = cat.codes.to_numpy(dtype=np.intp) + 1
+    index = cat.categories.rename(column)
+
+    def total(weights: np.ndarray | None = None) -> np.ndarray:
+        return np.bincount(codes, weights=weights, minlength=len(index) + 1)[1:]
+
+    perf = pd.DataFrame(
+        {
+            "Orders": total(has_order).astype("int64"),
+            "Delivered_On_Time": pd.Series(total(on_time), index=index) / total(is_rated),
+        },
+        index=index,
+    )
+    return perf[total() > 0]
+
+
 # ===========================
 # UI
 # ===========================
+# Rates render as whole percentages but stay numeric, so the tables
+# still sort by value; a Styler would format every cell in Python
+RATE_COLUMN_CONFIG = {
+    "Delivered_On_Time": st.column_config.NumberColumn(format="%.0f%%"),
+}
+
+
+def show_rate_table(perf: pd.DataFrame) -> None:
+    st.dataframe(
+        perf.assign(Delivered_On_Time=perf["Delivered_On_Time"] * 100),
+        column_config=RATE_COLUMN_CONFIG,
+    )
+
+
 st.title("📦 Supply Chain Fulfillment Dashboard — 2025")
 
 k1, k2 = st.columns(2)
@@ -122,49 +256,38 @@ k2.metric(
 # ===========================
 # MONTHLY TREND
 # ===========================
-prod_df["month"] = prod_df["eventdate"].dt.month
-deliv_df["month"] = deliv_df["delivery"].dt.month
-
-monthly_prod = prod_df.groupby("month")["producedontime"].mean()
-monthly_del = deliv_df.groupby("month")["delivered_on_time"].mean()
-
-trend_df = pd.concat([monthly_prod, monthly_del], axis=1)
-trend_df.columns = ["Produced On Time", "Delivered On Time"]
-
 st.subheader("📈 Monthly Performance Trend")
-st.line_chart(trend_df)
+st.line_chart(monthly_perf)
 
 # ===========================
 # SUPPLIER PERFORMANCE
 # ===========================
 st.subheader("🏭 Supplier Performance")
 
+sup_orders = prod_suppliers.groupby("supplier", observed=True, sort=False)[
+    "salesorderreference"
+].count()
+sup_on_time = rollup("supplier")["Delivered_On_Time"]
+
 supplier_perf = (
-    joined_df.groupby("supplier")
-    .agg(
-        Orders=("salesorderreference", "count"),
-        Delivered_On_Time=("delivered_on_time", "mean"),
-    )
+    pd.concat([sup_orders, sup_on_time], axis=1, keys=["Orders", "Delivered_On_Time"])
+    .fillna({"Orders": 0})
+    .astype({"Orders": "int64"})
     .sort_values("Delivered_On_Time", ascending=False)
 )
 
-st.dataframe(supplier_perf.style.format({"Delivered_On_Time": "{:.0%}"}))
+show_rate_table(supplier_perf)
 
 # ===========================
 # COUNTRY PERFORMANCE
 # ===========================
 st.subheader("🌍 Delivery Country Performance")
 
-country_perf = (
-    deliv_df.groupby("delivery_country_code")
-    .agg(
-        Orders=("soreference", "count"),
-        Delivered_On_Time=("delivered_on_time", "mean"),
-    )
-    .sort_values("Delivered_On_Time", ascending=False)
+country_perf = rollup("delivery_country_code").sort_values(
+    "Delivered_On_Time", ascending=False
 )
 
-st.dataframe(country_perf.style.format({"Delivered_On_Time": "{:.0%}"}))
+show_rate_table(country_perf)
 
 
 